@@ -0,0 +1,50 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Time decoding every animation of ANIM.HQR into its keyframe arrays.
+
+Usage: python bench_anims.py <LBA2 folder>/ANIM.HQR
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lba2maya'))
+
+from hqrreader import HQRReader
+from lba2parser import read_lba2_anim
+
+
+def bench(path, repeat):
+    with HQRReader(path, zero_copy=True) as reader:
+        entries = [reader[i] for i in range(len(reader)) if reader.index.sizes_full[i] > 0]
+        anims = [read_lba2_anim(entry) for entry in entries]
+        seconds = min(timeit.repeat(lambda: [read_lba2_anim(entry) for entry in entries], number=1, repeat=repeat))
+    keyframes = sum(anim.num_keyframes for anim in anims)
+    boneframes = sum(anim.num_keyframes * anim.num_boneframes for anim in anims)
+    print("%s: %d animations, %d keyframes, %d boneframes" % (
+        os.path.basename(path), len(anims), keyframes, boneframes))
+    print("  decoded in %.3f s (%.2f us per boneframe)" % (seconds, seconds * 1e6 / max(boneframes, 1)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    bench(sys.argv[1], 3)
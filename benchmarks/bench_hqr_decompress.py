@@ -0,0 +1,98 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Compare the slice-based HQR decompressor with the original byte loop.
+
+Usage: python bench_hqr_decompress.py <LBA2 folder>/BODY.HQR [ANIM.HQR ...]
+"""
+
+import io
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lba2maya'))
+
+from hqrreader import HQRReader, decompress
+
+
+def byte_loop_decompress(source, size_full, compression_type):
+    # The decoder HQRReader used before, reading one byte at a time
+    f = io.BytesIO(bytes(source))
+
+    def u8():
+        return struct.unpack('<B', f.read(1))[0]
+
+    def u16():
+        return struct.unpack('<H', f.read(2))[0]
+
+    decompressed = bytearray()
+    while True:
+        flags = u8()
+        for i in range(8):
+            if (flags >> i) & 1:
+                decompressed.append(u8())
+                if len(decompressed) == size_full:
+                    return decompressed
+            else:
+                header = u16()
+                offset = 1 + (header >> 4)
+                length = 1 + compression_type + (header & 15)
+
+                for i in range(length):
+                    decompressed.append(decompressed[-offset])
+
+                if len(decompressed) >= size_full:
+                    return decompressed[:size_full]
+
+
+def compressed_entries(path):
+    with HQRReader(path) as reader:
+        index = reader.index
+        for i in range(len(index)):
+            if index.sizes_full[i] == 0 or index.compression_types[i] == 0:
+                continue
+            start = index.offsets[i] + 10
+            source = bytes(reader._data[start:start + index.sizes_compressed[i]])
+            yield source, index.sizes_full[i], index.compression_types[i]
+
+
+def bench(path, repeat):
+    entries = list(compressed_entries(path))
+    for entry in entries:
+        if decompress(*entry) != byte_loop_decompress(*entry):
+            raise RuntimeError("decoders disagree on %s" % path)
+
+    def run(decoder):
+        return min(timeit.repeat(lambda: [decoder(*entry) for entry in entries], number=1, repeat=repeat))
+
+    old = run(byte_loop_decompress)
+    new = run(decompress)
+    total = sum(entry[1] for entry in entries)
+    print("%s: %d compressed entries, %d bytes" % (os.path.basename(path), len(entries), total))
+    print("  byte loop: %8.3f s" % old)
+    print("  slices:    %8.3f s  (%.1fx)" % (new, old / new if new else float('inf')))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    for archive in sys.argv[1:]:
+        bench(archive, 3)
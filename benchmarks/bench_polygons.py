@@ -0,0 +1,93 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Compare decoding polygon sections at once with decoding them block by block.
+
+Usage: python bench_polygons.py <LBA2 folder>/BODY.HQR
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lba2maya'))
+
+from hqrreader import HQRReader
+from lba2parser import EntryReader, ModelArrays, load_polygon, load_polygon_section
+
+
+def polygon_sections(entry):
+    r = EntryReader(entry)
+    polygons_offset, = r.unpack_at('<I', 0x44)
+    lines_offset, = r.unpack_at('<I', 0x4C)
+    r.seek(polygons_offset)
+    while r.tell() < lines_offset:
+        render_type, num_polygons, section_size, unk1 = r.values('HHHH', 1)
+        if section_size == 0:
+            break
+        block_size = (section_size - 8) // num_polygons
+        yield r.reader(r.tell(), num_polygons * block_size), render_type, num_polygons, block_size
+        r.skip(num_polygons * block_size)
+
+
+def by_block(sections):
+    arrays = ModelArrays()
+    for section, render_type, num_polygons, block_size in sections:
+        for i in range(num_polygons):
+            load_polygon(section, arrays, i * block_size, render_type, block_size)
+    return arrays
+
+
+def by_section(sections):
+    arrays = ModelArrays()
+    for section, render_type, num_polygons, block_size in sections:
+        section.seek(0)
+        if not load_polygon_section(section, arrays, render_type, num_polygons, block_size):
+            for i in range(num_polygons):
+                load_polygon(section, arrays, i * block_size, render_type, block_size)
+    return arrays
+
+
+def bench(path, repeat):
+    with HQRReader(path, zero_copy=True) as reader:
+        bodies = [list(polygon_sections(reader[i])) for i in range(len(reader)) if reader.index.sizes_full[i] > 0]
+        old_arrays = [by_block(sections) for sections in bodies]
+        new_arrays = [by_section(sections) for sections in bodies]
+        for old, new in zip(old_arrays, new_arrays):
+            for name in ('poly_starts', 'poly_counts', 'poly_indices', 'poly_uvs', 'poly_colours',
+                         'poly_intensities', 'poly_textures', 'poly_render_types', 'poly_has_tex'):
+                if getattr(old, name) != getattr(new, name):
+                    raise RuntimeError("decoders disagree on %s" % name)
+
+        def run(decoder):
+            return min(timeit.repeat(lambda: [decoder(sections) for sections in bodies], number=1, repeat=repeat))
+
+        old = run(by_block)
+        new = run(by_section)
+        faces = sum(len(arrays.poly_counts) for arrays in old_arrays)
+        print("%s: %d bodies, %d polygons" % (os.path.basename(path), len(bodies), faces))
+        print("  by block:   %8.3f s  (%.2f us per polygon)" % (old, old * 1e6 / max(faces, 1)))
+        print("  by section: %8.3f s  (%.2f us per polygon, %.1fx)" % (
+            new, new * 1e6 / max(faces, 1), old / new if new else float('inf')))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    bench(sys.argv[1], 3)
@@ -0,0 +1,98 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Compare writing skin weights in one MFnSkinCluster.setWeights call with
+selecting every vertex of every bone and calling skinPercent.
+
+Usage: mayapy bench_skinning.py [--bones N] [--vertices N]
+
+Both paths bind a mesh to a chain of joints, every vertex rigidly
+following one of them, and must end up with the same weights.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lba2maya'))
+
+
+def build_scene(pm, num_bones, num_vertices, seed=0):
+    pm.newFile(force=True)
+    side = max(int(num_vertices ** 0.5) - 1, 1)
+    plane = pm.polyPlane(sx=side, sy=side, w=10, h=10)[0].getShape()
+    pm.select(clear=True)
+    bones = [pm.joint(p=(0, i, 0), name='joint%d' % i) for i in range(num_bones)]
+    rnd = random.Random(seed)
+    vertex_bones = [rnd.randrange(num_bones) for i in range(len(plane.vtx))]
+    return plane, bones, vertex_bones
+
+
+def legacy_skin(pm, mesh, bones, vertex_bones):
+    # The path mesh_generator used before: one influence, one selection and one skinPercent at a time
+    cluster = pm.skinCluster(bones[0], mesh, tsb=True, mi=1, hmf=1.0, dr=10, nw=0)
+    for i in range(1, len(bones)):
+        pm.skinCluster(cluster, edit=True, ai=bones[i], tsb=True, hmf=1.0, dr=10, wt=0)
+    vertex_groups = [[] for bone in bones]
+    for i, bone in enumerate(vertex_bones):
+        vertex_groups[bone].append(i)
+    transform_zeros = [[bone, 0] for bone in bones]
+    for i, group in enumerate(vertex_groups):
+        pm.select(clear=True)
+        for vertex in group:
+            pm.select(mesh.vtx[vertex], add=True)
+        for j in range(len(transform_zeros)):
+            transform_zeros[j][1] = 1 if i == j else 0
+        pm.skinPercent(cluster, transformValue=transform_zeros, nrm=True)
+    return cluster
+
+
+def check_weights(pm, cluster, mesh, bones, vertex_bones):
+    for i in range(0, len(vertex_bones), max(len(vertex_bones) // 50, 1)):
+        weight = pm.skinPercent(cluster, mesh.vtx[i], transform=bones[vertex_bones[i]], query=True)
+        if abs(weight - 1) > 1e-6:
+            raise RuntimeError("vertex %d does not follow joint%d" % (i, vertex_bones[i]))
+
+
+def bench(num_bones, num_vertices):
+    import maya.standalone
+    maya.standalone.initialize()
+    import pymel.core as pm
+    from lba2maya import skin_mesh
+
+    timings = []
+    for skin in (lambda *args: legacy_skin(pm, *args), skin_mesh):
+        mesh, bones, vertex_bones = build_scene(pm, num_bones, num_vertices)
+        start = time.time()
+        cluster = skin(mesh, bones, vertex_bones)
+        timings.append(time.time() - start)
+        check_weights(pm, cluster, mesh, bones, vertex_bones)
+    print("%d joints, %d vertices" % (num_bones, len(vertex_bones)))
+    print("  select and skinPercent: %8.3f s" % timings[0])
+    print("  setWeights:             %8.3f s  (%.1fx)" % (timings[1], timings[0] / timings[1] if timings[1] else 0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bones', type=int, default=40)
+    parser.add_argument('--vertices', type=int, default=2000)
+    args = parser.parse_args()
+    bench(args.bones, args.vertices)
@@ -0,0 +1,64 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Time how long importing the parsers and the plug-in module takes, each in
+a fresh interpreter.
+
+Usage: python bench_startup.py [--runs N]
+
+Run it with mayapy to include the Maya bindings in the measurement: the
+plug-in module should cost about as much as the parsers, since pymel and
+OpenMaya are only imported when a scene is built.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lba2maya')
+
+TIMED_IMPORT = '''
+import sys, time
+sys.path.insert(0, %r)
+start = time.time()
+import %s
+print(time.time() - start)
+'''
+
+
+def time_import(module, runs, stderr=None):
+    timings = []
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', TIMED_IMPORT % (PLUGIN_DIR, module)], stderr=stderr)
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return min(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    for module in ('lba2parser', 'lba2maya'):
+        print('import %-10s %8.1f ms' % (module, time_import(module, args.runs) * 1000))
+    try:
+        with open(os.devnull, 'w') as devnull:
+            print('import %-10s %8.1f ms' % ('pymel.core', time_import('pymel.core', args.runs, devnull) * 1000))
+    except subprocess.CalledProcessError:
+        print('pymel.core is not available, run this with mayapy to compare against it')
@@ -0,0 +1,81 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+"""
+Parse every body, animation and the palette of an install through both
+the stream and the zero-copy readers, and check they agree. Run it with
+the Python of Maya 2020 (2.7) as well as with Python 3.
+
+Usage: python check_parsers.py <LBA2 folder>
+"""
+
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lba2maya'))
+
+from diskcache import DiskCache
+from hqrreader import HQRReader
+from lba2parser import find_archives, load_information, load_palette, read_lba2_anim, read_lba2_model
+
+
+def entries(path, disk_cache):
+    stream = HQRReader(path)
+    with HQRReader(path, zero_copy=True, disk_cache=disk_cache) as zero_copy:
+        for index in range(len(zero_copy)):
+            if zero_copy.index.sizes_full[index] > 0:
+                yield index, stream[index], zero_copy[index]
+
+
+def same_arrays(a, b):
+    return sorted(vars(a)) == sorted(vars(b)) and all(getattr(b, name) == value for name, value in vars(a).items())
+
+
+def check(folder):
+    archives = find_archives(folder)
+    cache_dir = tempfile.mkdtemp()
+    failed = []
+    try:
+        # The second pass reads the decompressed entries back from the disk cache
+        for disk_cache in (DiskCache(cache_dir), DiskCache(cache_dir)):
+            with HQRReader(archives['RESS.HQR'], zero_copy=True, disk_cache=disk_cache) as ress_file:
+                if load_palette(ress_file[0]) != load_palette(HQRReader(archives['RESS.HQR'])[0]):
+                    failed.append(('palette', 0))
+                load_information(ress_file[44])
+            for name, parse in (('BODY.HQR', read_lba2_model), ('ANIM.HQR', read_lba2_anim)):
+                for index, stream, zero_copy in entries(archives[name], disk_cache):
+                    try:
+                        if not same_arrays(parse(stream).arrays, parse(zero_copy).arrays):
+                            failed.append((name, index))
+                    except Exception as e:
+                        print('%s %4d: %s: %s' % (name, index, type(e).__name__, e))
+                        failed.append((name, index))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print('Python %s: %d entries differ or failed' % (platform.python_version(), len(failed)))
+    return not failed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    sys.exit(0 if check(sys.argv[1]) else 1)
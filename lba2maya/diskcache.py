@@ -0,0 +1,178 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+#
+# Copyright (C) 2021  Bruno Tuma <bruno.tuma@outlook.com>
+
+import hashlib
+import os
+import pickle
+import shutil
+
+# Bump whenever the layout of cached entries or parsed objects changes
+FORMAT_VERSION = 7
+# Space cached archives may take together before the least recently used ones are removed
+MAX_BYTES = 1024 * 1024 * 1024
+
+
+class DiskCache(object):
+    """
+    Persistent cache of decompressed .HQR entries and parsed results.
+
+    Everything cached for an archive lives in a directory named after the
+    archive and a hash of its content, under a directory for the current
+    FORMAT_VERSION. Changed game files or another install hash differently
+    and get a directory of their own. Once the cache grows past max_bytes,
+    the directories of the archives used least recently are removed, never
+    one this process uses.
+    """
+
+    def __init__(self, root, max_bytes=MAX_BYTES):
+        self.root = os.path.join(root, 'v%d' % FORMAT_VERSION)
+        self.max_bytes = max_bytes
+        self._hashes = {}
+        self._used = set()
+
+    def archive_hash(self, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        if key not in self._hashes:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha1.update(chunk)
+            self._hashes[key] = sha1.hexdigest()
+        return self._hashes[key]
+
+    def _directory(self, archive):
+        directory = os.path.join(self.root, '%s-%s' % (os.path.basename(archive).upper(), self.archive_hash(archive)))
+        if directory not in self._used:
+            self._used.add(directory)
+            # Mark it as used so trimming removes other archives first
+            try:
+                os.utime(directory, None)
+            except OSError:
+                pass
+        return directory
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def _write(self, archive, name, data):
+        directory = self._directory(archive)
+        try:
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    # Another process may have just created it
+                    if not os.path.isdir(directory):
+                        raise
+                self._trim()
+        except (IOError, OSError):
+            return
+        path = os.path.join(directory, name)
+        # Write next to the target first so readers never see a partial file
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            _replace(temp_path, path)
+        except (IOError, OSError):
+            # Another process may hold the target open, the entry simply stays uncached
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _trim(self):
+        # Remove the directories of the archives used least recently until the cache fits in max_bytes
+        total = 0
+        unused = []
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            size = _tree_size(directory)
+            total += size
+            if directory not in self._used:
+                try:
+                    unused.append((os.path.getmtime(directory), size, directory))
+                except OSError:
+                    pass
+        for mtime, size, directory in sorted(unused):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+
+    def load_entry(self, archive, index):
+        return self._read(os.path.join(self._directory(archive), 'entry%d.bin' % index))
+
+    def store_entry(self, archive, index, data):
+        self._write(archive, 'entry%d.bin' % index, bytes(data))
+
+    def load(self, archive, name):
+        data = self._read(os.path.join(self._directory(archive), name + '.pickle'))
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # Written by an incompatible version of the plug-in
+            return None
+
+    def store(self, archive, name, value):
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        self._write(archive, name + '.pickle', data)
+
+    def cached(self, archive, name, build):
+        value = self.load(archive, name)
+        if value is None:
+            value = build()
+            self.store(archive, name, value)
+        return value
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _replace(source, destination):
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        # Python 2 can only rename over an existing file outside Windows
+        if os.name == 'nt' and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def _tree_size(directory):
+    size = 0
+    for path, names, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(path, name))
+            except OSError:
+                # Removed by another process meanwhile
+                pass
+    return size
@@ -20,55 +20,269 @@
 # At https://github.com/vegard/blender-lba
 
 import io
+import mmap
+import os
 import struct
+from array import array
+from collections import OrderedDict
+
+
+class EntryCache(object):
+    """
+    Least recently used cache of decompressed .HQR entries, bounded by a
+    byte budget. Entries are keyed on (archive path, mtime, index), so one
+    cache can be shared by several readers and never serves data from an
+    archive that changed on disk.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Mark as most recently used
+        del self._entries[key]
+        self._entries[key] = data
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class HQRIndex(object):
+    """
+    Offset table of an .HQR archive, parsed once into compact arrays.
+    """
+
+    def __init__(self, data):
+        # The table is a list of u32 offsets; the first one points right past it
+        first_offset = struct.unpack_from('<I', data, 0)[0]
+        count = first_offset // 4
+        self.offsets = array('I', struct.unpack_from('<%dI' % count, data, 0))
+        # The last slot usually holds the archive size rather than an entry
+        if count and self.offsets[-1] >= len(data):
+            self.offsets.pop()
+        self.sizes_full = array('I')
+        self.sizes_compressed = array('I')
+        self.compression_types = array('H')
+        for offset in self.offsets:
+            if offset == 0 or offset + 10 > len(data):
+                # Blank entry
+                size_full, size_compressed, compression_type = 0, 0, 0
+            else:
+                size_full, size_compressed, compression_type = struct.unpack_from('<IIH', data, offset)
+            self.sizes_full.append(size_full)
+            self.sizes_compressed.append(size_compressed)
+            self.compression_types.append(compression_type)
+
+    def __len__(self):
+        return len(self.offsets)
 
 
 class HQRReader(object):
     """
     Read compressed and uncompressed files from an LBA .HQR archive.
+
+    Used as is, every lookup opens the archive again. Calling open() (or
+    using the reader as a context manager) maps the archive once, parses
+    its offset table into an HQRIndex and serves every entry from there.
+
+    With zero_copy set, an open reader returns memoryviews instead of
+    BytesIO objects: stored entries are slices of the mapping itself, so
+    they are never copied (except on Python 2, whose mmap cannot back a
+    memoryview). Such views must be released before close() can unmap
+    the archive.
+
+    An open reader given an EntryCache keeps decompressed entries there,
+    so looking the same entry up again skips decompression. A DiskCache
+    does the same across sessions.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, zero_copy=False, cache=None, disk_cache=None):
         self.path = path
+        self.zero_copy = zero_copy
+        self.cache = cache
+        self.disk_cache = disk_cache
+        self.index = None
+        self._file = None
+        self._data = None
+        self._cache_key = None
 
-    def __getitem__(self, index):
-        with open(self.path, 'rb') as f:
-            def u8():
-                return struct.unpack('<B', f.read(1))[0]
+    def open(self):
+        if self._data is None:
+            self._cache_key = (os.path.abspath(self.path), os.path.getmtime(self.path))
+            self._file = open(self.path, 'rb')
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index = HQRIndex(self._data)
+        return self
+
+    def close(self):
+        if self._data is not None:
+            try:
+                self._data.close()
+            except BufferError:
+                # Zero-copy views are still alive, the mapping goes away with them
+                pass
+            self._file.close()
+        self._data = None
+        self._file = None
+        self._cache_key = None
+        self.index = None
+
+    def __enter__(self):
+        return self.open()
 
-            def u16():
-                return struct.unpack('<H', f.read(2))[0]
+    def __exit__(self, *args):
+        self.close()
 
-            def u32():
-                return struct.unpack('<I', f.read(4))[0]
+    def __len__(self):
+        if self.index is not None:
+            return len(self.index)
+        with self as reader:
+            return len(reader.index)
 
+    def __iter__(self):
+        was_closed = self._data is None
+        self.open()
+        try:
+            for i in range(len(self.index)):
+                yield self[i]
+        finally:
+            if was_closed:
+                self.close()
+
+    def __getitem__(self, index):
+        if self._data is not None:
+            if index < 0:
+                index += len(self.index)
+            data = self._entry(index)
+            return data if self.zero_copy else io.BytesIO(data)
+
+        with open(self.path, 'rb') as f:
             f.seek(4 * index)
-            offset = u32()
+            offset = struct.unpack('<I', f.read(4))[0]
             f.seek(offset)
+            return _read_entry(f)
+
+    def _view(self, start, end):
+        try:
+            return memoryview(self._data)[start:end]
+        except TypeError:
+            # Python 2 mmaps have no buffer interface, so the entry is copied out of the mapping
+            return memoryview(self._data[start:end])
+
+    def _entry(self, index):
+        if self.index.sizes_full[index] == 0:
+            return memoryview(b'')
+        start = self.index.offsets[index] + 10
+        source = self._view(start, start + self.index.sizes_compressed[index])
+        if self.index.compression_types[index] == 0:
+            return source
+
+        key = self._cache_key + (index,)
+        data = self.cache.get(key) if self.cache is not None else None
+        if data is not None:
+            return memoryview(data)
+
+        if self.disk_cache is not None:
+            data = self.disk_cache.load_entry(self.path, index)
+        if data is None:
+            data = bytes(decompress(source, self.index.sizes_full[index], self.index.compression_types[index]))
+            if self.disk_cache is not None:
+                self.disk_cache.store_entry(self.path, index, data)
+        if self.cache is not None:
+            self.cache.put(key, data)
+        return memoryview(data)
+
+
+def _read_entry(f):
+    size_full, size_compressed, compression_type = struct.unpack('<IIH', f.read(10))
+
+    if compression_type == 0:
+        # No compression
+        return io.BytesIO(f.read(size_compressed))
+
+    return io.BytesIO(decompress(f.read(size_compressed), size_full, compression_type))
+
+
+def _flag_runs(flags):
+    # Split a flag byte into runs of literals (their count) and back-references (0)
+    runs = []
+    for i in range(8):
+        if (flags >> i) & 1:
+            if runs and runs[-1]:
+                runs[-1] += 1
+            else:
+                runs.append(1)
+        else:
+            runs.append(0)
+    return tuple(runs)
+
+
+_FLAG_RUNS = [_flag_runs(flags) for flags in range(256)]
+
+
+def decompress(source, size_full, compression_type):
+    """
+    Decode an LZ-compressed .HQR entry held in memory.
+
+    Literal runs and back-references are copied as slices; a reference
+    overlapping its own output repeats the last `offset` bytes instead.
+    """
+    src = bytearray(source)
+    end = len(src)
+    pos = 0
+    min_length = 1 + compression_type
+    decompressed = bytearray()
+    while len(decompressed) < size_full and pos < end:
+        flags = src[pos]
+        pos += 1
+        for run in _FLAG_RUNS[flags]:
+            if run:
+                decompressed += src[pos:pos + run]
+                pos += run
+            else:
+                header = src[pos] | (src[pos + 1] << 8)
+                pos += 2
+                offset = 1 + (header >> 4)
+                length = min_length + (header & 15)
+                start = len(decompressed) - offset
+                if start < 0:
+                    raise ValueError("back-reference before start of entry")
+                if offset >= length:
+                    decompressed += decompressed[start:start + length]
+                else:
+                    pattern = decompressed[start:]
+                    decompressed += (pattern * (length // offset + 1))[:length]
+            if len(decompressed) >= size_full:
+                break
 
-            size_full = u32()
-            size_compressed = u32()
-            compression_type = u16()
-
-            if compression_type == 0:
-                # No compression
-                return io.BytesIO(f.read(size_compressed))
-
-            decompressed = bytearray()
-            while True:
-                flags = u8()
-                for i in range(8):
-                    if (flags >> i) & 1:
-                        decompressed.append(u8())
-                        if len(decompressed) == size_full:
-                            return io.BytesIO(decompressed)
-                    else:
-                        header = u16()
-                        offset = 1 + (header >> 4)
-                        length = 1 + compression_type + (header & 15)
-
-                        for i in range(length):
-                            decompressed.append(decompressed[-offset])
-
-                        if len(decompressed) >= size_full:
-                            return io.BytesIO(decompressed[:size_full])
+    if len(decompressed) < size_full:
+        raise ValueError("compressed entry ends after %u of %u bytes" % (len(decompressed), size_full))
+    del decompressed[size_full:]
+    return decompressed
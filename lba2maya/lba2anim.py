@@ -0,0 +1,160 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+#
+# Copyright (C) 2021  Bruno Tuma <bruno.tuma@outlook.com>
+
+"""
+Animation curves of a body, built from its LBA2 animations without Maya.
+The plug-in only creates one anim curve per animated joint attribute and
+hands it all of its keys at once.
+"""
+
+from lba2parser import wrap_rotations
+
+ROTATE = ('rotateX', 'rotateY', 'rotateZ')
+TRANSLATE = ('translateX', 'translateY', 'translateZ')
+
+
+class AnimCurves(object):
+    """
+    Keys of every animated (bone, attribute) pair, as a value and whether
+    the key's out tangent is stepped, by time in seconds. Like setting
+    keys in Maya, a key set at an existing time replaces it.
+    """
+
+    def __init__(self):
+        self.keys = {}
+
+    def add(self, bone, attributes, time, values, step):
+        for attribute, value in zip(attributes, values):
+            self.keys.setdefault((bone, attribute), {})[time] = (value, step)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def curves(self, origin_bones=None):
+        # Yield bone, attribute, times, values and the indexes of stepped keys of every curve,
+        # moving translations by the rest position of their bone when origin_bones are given
+        for (bone, attribute), keys in sorted(self.keys.items()):
+            times = sorted(keys)
+            values = [keys[time][0] for time in times]
+            if origin_bones is not None and attribute in TRANSLATE:
+                origin = origin_bones[bone][TRANSLATE.index(attribute)]
+                values = [value + origin for value in values]
+            steps = [i for i, time in enumerate(times) if keys[time][1]]
+            yield bone, attribute, times, values, steps
+
+
+class AnimLibrary(object):
+    """
+    Animations shared by every body imported from an installation. Each
+    ANIM.HQR entry is parsed once, through load, and the curves of a list
+    of animations are built once per skeleton, given as the parent of
+    every bone. Those curves keep translations relative to the rest
+    position of their bone, so every body with the same skeleton can use
+    them by passing its own rest positions to AnimCurves.curves.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._anims = {}
+        self._curves = {}
+
+    def __contains__(self, anim_index):
+        return anim_index in self._anims
+
+    def add(self, anim_index, anim):
+        self._anims.setdefault(anim_index, anim)
+
+    def anim(self, anim_index):
+        if anim_index not in self._anims:
+            self._anims[anim_index] = self._load(anim_index)
+        return self._anims[anim_index]
+
+    def curves(self, anim_indexes, parents):
+        # Curves and clips list of the animations for a skeleton
+        key = (tuple(anim_indexes), tuple(parents))
+        if key not in self._curves:
+            anims = [self.anim(anim_index) for anim_index in anim_indexes]
+            self._curves[key] = build_curves(anims, [(0., 0., 0.)] * len(parents))
+        return self._curves[key]
+
+    def clear(self):
+        self._anims.clear()
+        self._curves.clear()
+
+
+def build_curves(animations, origin_bones):
+    # Lay every animation after the previous one, return their curves and the clips list
+    curves = AnimCurves()
+    clips = []
+    current_time = 0
+    for i, lba_anim in enumerate(animations):
+        arrays = lba_anim.arrays
+        rotations = wrap_rotations(arrays.vectors)
+        cut_t = -1
+        time = current_time
+        start_t = time * 0.3
+        # add first frame keys
+        for b in range(len(origin_bones)):
+            if lba_anim.num_boneframes <= b:
+                curves.add(b, ROTATE, time / 100., (0, 0, 0), True)
+                curves.add(b, TRANSLATE, time / 100., origin_bones[b], True)
+            elif b != 0:
+                if arrays.bone_types[b] == 0:
+                    curves.add(b, TRANSLATE, time / 100., origin_bones[b], True)
+                else:
+                    curves.add(b, ROTATE, time / 100., (0, 0, 0), True)
+        # how many frames this anim has, if the loopframe is different from the last frame add 1 extra frame.
+        length_frames = lba_anim.num_keyframes + 1 if lba_anim.loop_frame != (
+                lba_anim.num_keyframes - 1) else lba_anim.num_keyframes
+        for b in range(min(len(origin_bones), lba_anim.num_boneframes)):
+            time = current_time
+            root = [0, 0, 0]
+            for d in range(length_frames):
+                index = d
+                last_key = False
+                if d == length_frames - 1:  # if it's the last frame
+                    index = lba_anim.loop_frame  # last frame is always the loopframe
+                    last_key = True
+                boneframe = index * lba_anim.num_boneframes + b
+                vector = arrays.vectors[3 * boneframe:3 * boneframe + 3]
+                time += arrays.lengths[index] / 10. if d != 0 else 0
+                if d == lba_anim.loop_frame and cut_t == -1 and d != 0:
+                    cut_t = time * 0.3
+                calc_v = rotations[3 * boneframe:3 * boneframe + 3]
+                if b == 0:
+                    # the root bone always rotates, and moves by the keyframe offsets
+                    root = [c + offset for c, offset in zip(root, arrays.root[3 * index:3 * index + 3])]
+                    curves.add(b, ROTATE, time / 100., calc_v, last_key)
+                    curves.add(b, TRANSLATE, time / 100., [v + o for v, o in zip(root, origin_bones[b])], last_key)
+                elif arrays.bone_types[boneframe] == 0:
+                    curves.add(b, ROTATE, time / 100., calc_v, last_key)
+                else:
+                    curves.add(b, TRANSLATE, time / 100., [v + o for v, o in zip(vector, origin_bones[b])], last_key)
+        if lba_anim.num_boneframes < len(origin_bones):
+            # bones without boneframes used to reset the time before being skipped
+            time = current_time
+        end_t = time * 0.3
+        current_time = time + 100
+        if cut_t == -1:
+            clips += [str(i + 1).zfill(3), str(start_t), str(end_t)]
+        else:
+            clips += [str(i + 1).zfill(3) + "Start", str(start_t), str(cut_t)]
+            clips += [str(i + 1).zfill(3) + "Loop", str(cut_t), str(end_t)]
+    return curves, ';'.join(clips)
@@ -0,0 +1,218 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+#
+# Copyright (C) 2021  Bruno Tuma <bruno.tuma@outlook.com>
+
+"""
+Convert every LBA2 body and animation to JSON files with binary buffers,
+without Maya.
+
+Usage: python lba2convert.py <LBA2 folder> <output folder> [--jobs N]
+
+Each body is written as bodyNNN.json, describing its bones and the
+layout of the arrays stored in bodyNNN.bin, and each animation used by a
+body as animNNNN.json with its keyframe arrays in animNNNN.bin.
+index.json lists what was converted.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from body_info import body_names
+from diskcache import DiskCache
+from hqrreader import HQRReader
+from lba2parser import find_archives, load_information, load_palette, read_lba2_anim, read_lba2_model
+
+# Archives opened once per worker process
+_readers = {}
+
+
+def _reader(path):
+    if path not in _readers:
+        _readers[path] = HQRReader(path, zero_copy=True).open()
+    return _readers[path]
+
+
+def write_buffers(path, buffers):
+    # Store arrays 4-byte aligned in a little-endian .bin file, return their layout
+    layout = {}
+    offset = 0
+    with open(path, 'wb') as f:
+        for name, values in buffers:
+            if sys.byteorder != 'little':
+                values = values.__copy__()
+                values.byteswap()
+            data = values.tostring() if sys.version_info[0] < 3 else values.tobytes()
+            layout[name] = {'offset': offset, 'count': len(values), 'type': values.typecode}
+            padding = -len(data) % 4
+            f.write(data + b'\0' * padding)
+            offset += len(data) + padding
+    return layout
+
+
+def convert_body(body_path, output, body_index, animations):
+    model = read_lba2_model(_reader(body_path)[body_index])
+    arrays = model.arrays
+    name = 'body%03d' % body_index
+    layout = write_buffers(os.path.join(output, name + '.bin'), [
+        ('vertices', arrays.vertices),
+        ('vertex_bones', arrays.vertex_bones),
+        ('normals', arrays.normals),
+        ('poly_counts', arrays.poly_counts),
+        ('poly_indices', arrays.poly_indices),
+        ('poly_uvs', arrays.poly_uvs),
+        ('poly_colours', arrays.poly_colours),
+        ('poly_intensities', arrays.poly_intensities),
+        ('poly_textures', arrays.poly_textures),
+        ('poly_has_tex', arrays.poly_has_tex),
+        ('lines', arrays.lines),
+        ('line_colours', arrays.line_colours),
+        ('spheres', arrays.spheres),
+        ('sphere_colours', arrays.sphere_colours),
+    ])
+    description = {
+        'body': body_index,
+        'name': body_names[body_index] if body_index < len(body_names) else '',
+        'bones': [{'parent': bone.parent, 'vertex': bone.vertex} for bone in model.bones],
+        'uv_groups': [(group.x, group.y, group.w, group.h) for group in model.uvgroups],
+        'animations': animations,
+        'buffer': name + '.bin',
+        'arrays': layout,
+    }
+    with open(os.path.join(output, name + '.json'), 'w') as f:
+        json.dump(description, f)
+
+
+def convert_anim(anim_path, output, anim_index):
+    anim = read_lba2_anim(_reader(anim_path)[anim_index])
+    arrays = anim.arrays
+    name = 'anim%04d' % anim_index
+    layout = write_buffers(os.path.join(output, name + '.bin'), [
+        ('lengths', arrays.lengths),
+        ('root', arrays.root),
+        ('can_fall', arrays.can_fall),
+        ('bone_types', arrays.bone_types),
+        ('vectors', arrays.vectors),
+    ])
+    description = {
+        'anim': anim_index,
+        'keyframes': anim.num_keyframes,
+        'bones': anim.num_boneframes,
+        'loop_frame': anim.loop_frame,
+        'buffer': name + '.bin',
+        'arrays': layout,
+    }
+    with open(os.path.join(output, name + '.json'), 'w') as f:
+        json.dump(description, f)
+
+
+def parse_character(job):
+    # Parse a body and the animations it uses, for the Maya plug-in to build in the scene. The archives are
+    # given by path, so workers never scan the install folder again.
+    body_path, anim_path, cache_dir, body_index, anim_indexes = job
+    try:
+        cache = DiskCache(cache_dir)
+        body_reader = _reader(body_path)
+        anim_reader = _reader(anim_path)
+        model = cache.cached(body_reader.path, 'body%d' % body_index,
+                             lambda: read_lba2_model(body_reader[body_index]))
+        anims = [cache.cached(anim_reader.path, 'anim%d' % anim_index, lambda: read_lba2_anim(anim_reader[anim_index]))
+                 for anim_index in anim_indexes]
+    except Exception as e:
+        return body_index, None, None, '%s: %s' % (type(e).__name__, e)
+    return body_index, model, anims, None
+
+
+def run_job(job):
+    kind, path, output, index, extra = job
+    start = time.time()
+    try:
+        if kind == 'body':
+            convert_body(path, output, index, extra)
+        else:
+            convert_anim(path, output, index)
+        error = None
+    except Exception as e:
+        error = '%s: %s' % (type(e).__name__, e)
+    return kind, index, time.time() - start, error
+
+
+def convert(folder, output, jobs=None):
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    archives = find_archives(folder)
+    for name in ('BODY.HQR', 'RESS.HQR', 'ANIM.HQR'):
+        if name not in archives:
+            raise IOError("%s not found in %s" % (name, folder))
+
+    with HQRReader(archives['RESS.HQR'], zero_copy=True) as ress_file:
+        palette = load_palette(ress_file[0])
+        resources = load_information(ress_file[44])
+    with HQRReader(archives['BODY.HQR']) as body_file:
+        bodies = [i for i in range(len(body_file)) if body_file.index.sizes_full[i] > 0]
+
+    work = []
+    anim_indexes = set()
+    for body_index in bodies:
+        animations = [anim.realIndex for anim in resources.animations_for_body(body_index)]
+        anim_indexes.update(animations)
+        work.append(('body', archives['BODY.HQR'], output, body_index, animations))
+    work += [('anim', archives['ANIM.HQR'], output, anim_index, None) for anim_index in sorted(anim_indexes)]
+
+    start = time.time()
+    failed = []
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for kind, index, seconds, error in pool.imap_unordered(run_job, work):
+            print('%s %4d: %7.1f ms%s' % (kind, index, seconds * 1000, '  FAILED ' + error if error else ''))
+            if error:
+                failed.append((kind, index))
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(os.path.join(output, 'index.json'), 'w') as f:
+        json.dump({
+            'palette': palette,
+            'bodies': ['body%03d.json' % i for i in bodies if ('body', i) not in failed],
+            'animations': ['anim%04d.json' % i for i in sorted(anim_indexes) if ('anim', i) not in failed],
+        }, f)
+    print('%d bodies and %d animations in %.2f s, %d failed' % (
+        len(bodies), len(anim_indexes), time.time() - start, len(failed)))
+    return len(failed) == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='LBA2 installation folder')
+    parser.add_argument('output', help='folder receiving the converted files')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+    try:
+        return 0 if convert(args.folder, args.output, args.jobs) else 1
+    except IOError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+#
+# Copyright (C) 2021  Bruno Tuma <bruno.tuma@outlook.com>
+
+"""
+Flat geometry buffers for building a body as a single Maya mesh.
+Nothing here depends on Maya, the plug-in only hands the buffers over to
+MFnMesh.
+"""
+
+import math
+from array import array
+
+from lba2parser import WORLD_SCALE
+
+
+class MeshBuffers(object):
+    """
+    Everything MFnMesh needs to create a mesh in one call: points as
+    x, y, z triplets, the vertex count of every face with their vertex
+    indices, one UV per face vertex and normals for the vertices listed in
+    normal_ids. Every face also keeps its palette colour and whether its
+    UVs come from a texture, and every vertex the bone it follows.
+    """
+
+    def __init__(self):
+        self.points = array('f')
+        self.vertex_bones = array('H')
+        self.normals = array('f')
+        self.normal_ids = array('i')
+        self.counts = array('i')
+        self.connects = array('i')
+        self.u = array('f')
+        self.v = array('f')
+        self.face_colours = array('B')
+        self.face_textured = array('B')
+
+    @property
+    def num_vertices(self):
+        return len(self.vertex_bones)
+
+    @property
+    def num_faces(self):
+        return len(self.counts)
+
+
+def model_buffers(lba_model):
+    arrays = lba_model.arrays
+    buffers = MeshBuffers()
+    buffers.points = array('f', arrays.vertices)
+    buffers.vertex_bones = array('H', arrays.vertex_bones)
+    # Bodies may store fewer normals than vertices, the rest keep Maya's
+    buffers.normals = array('f', arrays.normals[:len(arrays.vertices)])
+    buffers.normal_ids = array('i', range(len(buffers.normals) // 3))
+    buffers.counts = array('i', arrays.poly_counts)
+    buffers.connects = array('i', arrays.poly_indices)
+    # Texture coordinates are bytes into the texture page, with v growing downwards
+    buffers.u = array('f', [u / 255. for u in arrays.poly_uvs[0::2]])
+    buffers.v = array('f', [1 - v / 255. for v in arrays.poly_uvs[1::2]])
+    buffers.face_colours = array('B', arrays.poly_colours)
+    buffers.face_textured = array('B', arrays.poly_has_tex)
+    return buffers
+
+
+# Unit sphere and cylinder meshes by resolution, as points, normals, face counts and face connects
+_sphere_templates = {}
+_cylinder_templates = {}
+
+
+def append_mesh(buffers, points, normals, counts, connects, bones, colour):
+    # Add a mesh given as flat points and normals, faces of local vertex indices and the bone of every point
+    first = buffers.num_vertices
+    buffers.points.extend(points)
+    buffers.normals.extend(normals)
+    buffers.normal_ids.extend(range(first, first + len(normals) // 3))
+    buffers.vertex_bones.extend(bones)
+    buffers.counts.extend(counts)
+    buffers.connects.extend(array('i', [first + i for i in connects]))
+    buffers.face_colours.extend(array('B', [colour]) * len(counts))
+    # Primitives are untextured, their UVs are only there to match the face vertex count until projected
+    buffers.face_textured.extend(array('B', [0]) * len(counts))
+    buffers.u.extend(array('f', [0.]) * len(connects))
+    buffers.v.extend(array('f', [0.]) * len(connects))
+
+
+def face_buffers(faces):
+    return array('i', [len(face) for face in faces]), array('i', [i for face in faces for i in face])
+
+
+def sphere_template(resolution):
+    # Unit sphere laid out like polySphere, rings then both poles, with its poles along the Z axis. Like
+    # polySphere, it has at least 3 subdivisions around and 2 from pole to pole.
+    if resolution not in _sphere_templates:
+        around, height = max(resolution, 3), max(resolution, 2)
+        points = []
+        for ring in range(1, height):
+            phi = math.pi * ring / height - math.pi / 2
+            for i in range(around):
+                theta = 2 * math.pi * i / around
+                points += [math.cos(phi) * math.cos(theta), math.cos(phi) * math.sin(theta), math.sin(phi)]
+        bottom = len(points) // 3
+        points += [0., 0., -1., 0., 0., 1.]
+
+        faces = []
+        for i in range(around):
+            j = (i + 1) % around
+            faces.append((bottom, j, i))
+            for ring in range(height - 2):
+                row = ring * around
+                faces.append((row + i, row + j, row + around + j, row + around + i))
+            row = (height - 2) * around
+            faces.append((row + i, row + j, bottom + 1))
+        _sphere_templates[resolution] = (array('f', points),) + face_buffers(faces)
+    return _sphere_templates[resolution]
+
+
+def cylinder_template(resolution):
+    # Unit radius cylinder laid out like polyCylinder, a ring at Y 0 then a ring at Y 1, with its normals
+    if resolution not in _cylinder_templates:
+        ring = [(math.cos(2 * math.pi * i / resolution), -math.sin(2 * math.pi * i / resolution))
+                for i in range(resolution)]
+        points = [c for y in (0., 1.) for x, z in ring for c in (x, y, z)]
+        normals = [c for x, z in ring for c in (x, 0., z)] * 2
+        faces = [(i, (i + 1) % resolution, resolution + (i + 1) % resolution, resolution + i)
+                 for i in range(resolution)]
+        faces.append(tuple(reversed(range(resolution))))
+        faces.append(tuple(range(resolution, 2 * resolution)))
+        _cylinder_templates[resolution] = (array('f', points), array('f', normals)) + face_buffers(faces)
+    return _cylinder_templates[resolution]
+
+
+def line_axes(dx, dy, dz):
+    # Where the cylinder's X and Z axes go once its Y axis is turned towards dx, dy, dz around Z then Y
+    dist = math.sqrt(dx * dx + dy * dy + dz * dz)
+    spread = math.sqrt(dx * dx + dz * dz)
+    if dist == 0:
+        return (1., 0., 0.), (0., 0., 1.)
+    cos_t, sin_t = dy / dist, spread / dist
+    cos_p, sin_p = (-dx / spread, dz / spread) if spread else (1., 0.)
+    return (cos_p * cos_t, sin_t, -sin_p * cos_t), (sin_p, 0., cos_p)
+
+
+def append_spheres(buffers, lba_model, resolution):
+    arrays = lba_model.arrays
+    points = arrays.vertices
+    normals, counts, connects = sphere_template(resolution)
+    for i, colour in enumerate(arrays.sphere_colours):
+        vertex, size = arrays.spheres[2 * i], arrays.spheres[2 * i + 1]
+        radius = size * WORLD_SCALE
+        x, y, z = points[3 * vertex:3 * vertex + 3]
+        sphere_points = array('f', normals)
+        sphere_points[0::3] = array('f', [x + c * radius for c in normals[0::3]])
+        sphere_points[1::3] = array('f', [y + c * radius for c in normals[1::3]])
+        sphere_points[2::3] = array('f', [z + c * radius for c in normals[2::3]])
+        append_mesh(buffers, sphere_points, normals, counts, connects,
+                    array('H', [arrays.vertex_bones[vertex]]) * (len(normals) // 3), colour)
+
+
+def append_lines(buffers, lba_model, resolution, radius):
+    arrays = lba_model.arrays
+    points = arrays.vertices
+    unit_points, unit_normals, counts, connects = cylinder_template(resolution)
+    xs, ys, zs = unit_points[0::3], unit_points[1::3], unit_points[2::3]
+    for i, colour in enumerate(arrays.line_colours):
+        vertex1, vertex2 = arrays.lines[2 * i], arrays.lines[2 * i + 1]
+        start = points[3 * vertex1:3 * vertex1 + 3]
+        direction = [b - a for a, b in zip(start, points[3 * vertex2:3 * vertex2 + 3])]
+        # The unit Y axis stretches to the second vertex, X and Z scale to the radius
+        x_axis, z_axis = line_axes(*direction)
+        line_points = array('f', unit_points)
+        line_normals = array('f', unit_normals)
+        for k in range(3):
+            x_scale, z_scale = radius * x_axis[k], radius * z_axis[k]
+            line_points[k::3] = array('f', [start[k] + x * x_scale + y * direction[k] + z * z_scale
+                                            for x, y, z in zip(xs, ys, zs)])
+            line_normals[k::3] = array('f', [x * x_axis[k] + z * z_axis[k]
+                                             for x, z in zip(unit_normals[0::3], unit_normals[2::3])])
+        # The first ring sits on the first vertex and follows its bone, the second ring the second's
+        bones = array('H', [arrays.vertex_bones[vertex1]]) * resolution + \
+            array('H', [arrays.vertex_bones[vertex2]]) * resolution
+        append_mesh(buffers, line_points, line_normals, counts, connects, bones, colour)
+
+
+def index_ranges(indices):
+    # Collapse sorted indices into inclusive (first, last) runs
+    ranges = []
+    for i in indices:
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return [tuple(r) for r in ranges]
+
+
+def colour_face_ranges(buffers, lba_model):
+    # Runs of faces sharing every palette colour, the body's polygons coming from its colour index
+    faces = dict((colour, list(indices)) for colour, indices in lba_model.colour_faces.items())
+    for i in range(len(lba_model.arrays.poly_counts), buffers.num_faces):
+        faces.setdefault(buffers.face_colours[i], []).append(i)
+    return dict((colour, index_ranges(indices)) for colour, indices in faces.items())
+
+
+def untextured_face_ranges(buffers):
+    return index_ranges([i for i, textured in enumerate(buffers.face_textured) if not textured])
+
+
+def rigid_weights(vertex_bones, influences):
+    # Weights of every vertex for every influence in order, each vertex fully following its own bone
+    columns = dict((bone, i) for i, bone in enumerate(influences))
+    count = len(influences)
+    weights = array('d', [0.]) * (len(vertex_bones) * count)
+    for i, bone in enumerate(vertex_bones):
+        weights[i * count + columns[bone]] = 1.
+    return weights
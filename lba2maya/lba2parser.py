@@ -0,0 +1,776 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+#
+# Copyright (C) 2021  Bruno Tuma <bruno.tuma@outlook.com>
+
+import itertools
+import os
+import struct
+from array import array
+
+WORLD_SCALE = 0.15
+# Archive indexes of every folder scanned so far
+_archive_indexes = {}
+
+
+# Locate every .HQR archive below an installation folder
+def find_archives(folder):
+    folder = os.path.abspath(folder)
+    archives = _archive_indexes.get(folder)
+    if archives is None or not all(os.path.isfile(path) for path in archives.values()):
+        # Keys are upper case so lookups ignore the case used on disk
+        archives = {}
+        for root, dirs, files in os.walk(folder):
+            for name in files:
+                if name.upper().endswith('.HQR'):
+                    archives.setdefault(name.upper(), os.path.join(root, name))
+        _archive_indexes[folder] = archives
+    return archives
+
+
+# Read palette entry from RESS.HQR
+def load_palette(entry):
+    r = EntryReader(entry)
+    return r.records('BBB', 256)
+
+
+# Read characters information entry from RESS.HQR
+def load_information(entry):
+    return ResourceTable(iter_resources(entry))
+
+
+# Offsets of every resource in the information entry, followed by its end
+def resource_offsets(entry):
+    r = EntryReader(entry)
+    offsets = [r.s32()]
+    while r.tell() < offsets[0]:
+        offsets.append(r.s32())
+    return offsets
+
+
+# Yield every resource of the information entry in order
+def iter_resources(entry):
+    data = EntryReader(entry).data
+    offsets = resource_offsets(data)
+    for start, end in zip(offsets, offsets[1:]):
+        yield read_resource(data, start, end)
+
+
+# Read the resource stored between two offsets of the information entry
+def read_resource(entry, offset, end):
+    r = EntryReader(entry)
+    r.seek(offset)
+    ress = Resource()
+    ress.offset = offset
+    while r.tell() < end - 1:
+        ress.op_code = r.u8()
+        if ress.op_code == 1:  # is Body
+            body = RessBody()
+            body.index = r.u8()
+            body.dataSize = r.u8()
+            body.realIndex = r.s16()
+            body.collisionBoxFlag = r.u8()
+            if body.collisionBoxFlag == 1:
+                r.skip(13)
+            ress.bodies.append(body)
+        else:  # is Anim
+            anim = RessAnim()
+            anim.index = r.u16()
+            anim.dataSize = r.u8()
+            anim.realIndex = r.u16()
+            r.skip(anim.dataSize - 3)
+            ress.animations.append(anim)
+    return ress
+
+
+class ResourceTable(object):
+    """
+    Character resources from RESS.HQR, with reverse indexes from body
+    realIndex to the resources using it and from animation realIndex to
+    the bodies it is played on.
+    """
+
+    def __init__(self, resources):
+        self.resources = list(resources)
+        self.body_resources = {}
+        self.anim_bodies = {}
+        for resource in self.resources:
+            for body in resource.bodies:
+                self.body_resources.setdefault(body.realIndex, []).append(resource)
+                for anim in resource.animations:
+                    bodies = self.anim_bodies.setdefault(anim.realIndex, [])
+                    if body.realIndex not in bodies:
+                        bodies.append(body.realIndex)
+
+    def __len__(self):
+        return len(self.resources)
+
+    def __iter__(self):
+        return iter(self.resources)
+
+    def __getitem__(self, index):
+        return self.resources[index]
+
+    def animations_for_body(self, body_index):
+        # Animations of the first resource using the body, if any
+        for resource in self.body_resources.get(body_index, ()):
+            if len(resource.animations) > 0:
+                return resource.animations
+        return []
+
+
+class Resource(object):
+    offset = 0
+    op_code = 0
+
+    def __init__(self):
+        self.bodies = []
+        self.animations = []
+        pass
+
+
+class RessBody(object):
+    index = 0
+    dataSize = 0
+    realIndex = 0
+    collisionBoxFlag = 0
+
+    def __init__(self):
+        pass
+
+
+class RessAnim(object):
+    index = 0
+    realIndex = 0
+    dataSize = 0
+
+    def __init__(self):
+        pass
+
+
+# File Reader
+class EntryReader(object):
+    """
+    Reads little-endian values from a buffer, either at the current
+    position or at absolute offsets. The buffer is wrapped in a memoryview
+    so sub-readers and seeks never copy the entry.
+    """
+
+    def __init__(self, path, offset=0, size=None):
+        # Entries are either file-like objects or buffers from a zero-copy HQRReader
+        data = memoryview(path.read() if hasattr(path, 'read') else path)
+        self.data = data[offset:] if size is None else data[offset:offset + size]
+        self.currentIndex = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def seek(self, offset):
+        self.currentIndex = offset
+
+    def tell(self):
+        return self.currentIndex
+
+    def skip(self, n):
+        self.currentIndex += n
+
+    def reader(self, offset, size):
+        # Reader over size bytes at offset, sharing this reader's buffer
+        return EntryReader(self.data, offset, size)
+
+    def unpack_at(self, fmt, offset):
+        return struct.unpack_from(fmt, self.data, offset)
+
+    def unpack(self, fmt, size):
+        value = struct.unpack_from(fmt, self.data, self.currentIndex)[0]
+        self.currentIndex += size
+        return value
+
+    def u8(self):
+        return self.unpack('<B', 1)
+
+    def u16(self):
+        return self.unpack('<H', 2)
+
+    def values(self, fmt, count):
+        # Read count consecutive records laid out as the struct format fmt, as one flat tuple
+        values = struct.unpack_from('<' + fmt * count, self.data, self.currentIndex)
+        self.currentIndex += struct.calcsize('<' + fmt) * count
+        return values
+
+    def records(self, fmt, count):
+        # Read count consecutive records laid out as the struct format fmt, one tuple each
+        if count == 0:
+            return []
+        values = self.values(fmt, count)
+        return list(zip(*[iter(values)] * (len(values) // count)))
+
+    def u16_div(self, n):
+        x = self.u16()
+        if x % n != 0:
+            raise RuntimeError("%u is not divisible by %u" % (x, n))
+        return x // n
+
+    def s16_div(self, n):
+        x = self.s16()
+        if x == -1:
+            return x
+        if x % n != 0:
+            raise RuntimeError("%u is not divisible by %u" % (x, n))
+        return x // n
+
+    def s16(self):
+        return self.unpack('<h', 2)
+
+    def s32(self):
+        return self.unpack('<i', 4)
+
+    def u32(self):
+        return self.unpack('<I', 4)
+
+
+class ModelArrays(object):
+    """
+    Structure-of-arrays storage for the per-element data of a body.
+    Points are stored flat as x, y, z triplets, polygon vertex indices and
+    UVs flat in polygon order, with poly_starts pointing at each polygon's
+    first index.
+    """
+
+    def __init__(self):
+        self.vertices = array('f')
+        self.vertex_bones = array('H')
+        self.normals = array('f')
+        self.normal_unk1 = array('H')
+        self.poly_starts = array('I')
+        self.poly_counts = array('B')
+        self.poly_indices = array('H')
+        self.poly_uvs = array('B')
+        self.poly_colours = array('B')
+        self.poly_intensities = array('h')
+        self.poly_textures = array('B')
+        self.poly_render_types = array('H')
+        self.poly_has_tex = array('B')
+        self.lines = array('H')
+        self.line_colours = array('B')
+        self.line_unk1 = array('H')
+        self.spheres = array('H')
+        self.sphere_colours = array('B')
+        self.sphere_unk1 = array('H')
+
+
+class LBA2Model(object):
+    """
+    A parsed body. Per-element data lives in self.arrays; the vertices,
+    normals, polygons, lines and spheres lists are views over it that
+    are only built when asked for.
+    """
+
+    def __init__(self, arrays=None):
+        self.arrays = arrays if arrays is not None else ModelArrays()
+        self.bones = None
+        self.uvgroups = None
+        self.colour_faces = None
+        self._views = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_views'] = {}
+        return state
+
+    def _view_list(self, view_class, count):
+        if view_class not in self._views:
+            self._views[view_class] = [view_class(self.arrays, i) for i in range(count)]
+        return self._views[view_class]
+
+    @property
+    def vertices(self):
+        return self._view_list(Vertex, len(self.arrays.vertex_bones))
+
+    @property
+    def normals(self):
+        return self._view_list(Normal, len(self.arrays.normal_unk1))
+
+    @property
+    def polygons(self):
+        return self._view_list(Polygon, len(self.arrays.poly_counts))
+
+    @property
+    def lines(self):
+        return self._view_list(Line, len(self.arrays.line_colours))
+
+    @property
+    def spheres(self):
+        return self._view_list(Sphere, len(self.arrays.sphere_colours))
+
+
+def _array_field(name, stride=1, component=0):
+    # Property reading and writing one component of an element in ModelArrays
+    def fget(self):
+        return getattr(self._arrays, name)[stride * self.index + component]
+
+    def fset(self, value):
+        getattr(self._arrays, name)[stride * self.index + component] = value
+    return property(fget, fset)
+
+
+class ArrayView(object):
+    __slots__ = ('_arrays', 'index')
+
+    def __init__(self, arrays, index):
+        self._arrays = arrays
+        self.index = index
+
+
+class OriginalBone(object):
+    parent = 0
+    vertex = 0
+    unk1 = 0
+    unk2 = 0
+
+    def __init__(self):
+        pass
+
+
+class Vertex(ArrayView):
+    __slots__ = ()
+    x = _array_field('vertices', 3, 0)
+    y = _array_field('vertices', 3, 1)
+    z = _array_field('vertices', 3, 2)
+    bone = _array_field('vertex_bones')
+
+
+class Normal(ArrayView):
+    __slots__ = ()
+    x = _array_field('normals', 3, 0)
+    y = _array_field('normals', 3, 1)
+    z = _array_field('normals', 3, 2)
+    unk1 = _array_field('normal_unk1')
+
+
+class Unknown1(object):
+    unk1 = 0
+    unk2 = 0
+    unk3 = 0
+    unk4 = 0
+
+    def __init__(self):
+        pass
+
+
+class Polygon(ArrayView):
+    __slots__ = ()
+    renderType = _array_field('poly_render_types')
+    colour = _array_field('poly_colours')
+    intensity = _array_field('poly_intensities')
+    tex = _array_field('poly_textures')
+    numVertex = _array_field('poly_counts')
+
+    @property
+    def vertex(self):
+        start = self._arrays.poly_starts[self.index]
+        return self._arrays.poly_indices[start:start + self.numVertex].tolist()
+
+    @property
+    def u(self):
+        if not self.hasTex:
+            return []
+        start = self._arrays.poly_starts[self.index]
+        return self._arrays.poly_uvs[2 * start:2 * (start + self.numVertex):2].tolist()
+
+    @property
+    def v(self):
+        if not self.hasTex:
+            return []
+        start = self._arrays.poly_starts[self.index]
+        return self._arrays.poly_uvs[2 * start + 1:2 * (start + self.numVertex):2].tolist()
+
+    @property
+    def hasTex(self):
+        return bool(self._arrays.poly_has_tex[self.index])
+
+    @property
+    def hasExtra(self):
+        return bool(self.renderType & 0x4000)
+
+    @property
+    def hasTransparency(self):
+        return self.renderType == 2
+
+
+class Line(ArrayView):
+    __slots__ = ()
+    unk1 = _array_field('line_unk1')
+    colour = _array_field('line_colours')
+    vertex1 = _array_field('lines', 2, 0)
+    vertex2 = _array_field('lines', 2, 1)
+
+
+class Sphere(ArrayView):
+    __slots__ = ()
+    unk1 = _array_field('sphere_unk1')
+    colour = _array_field('sphere_colours')
+    vertex = _array_field('spheres', 2, 0)
+    size = _array_field('spheres', 2, 1)
+
+
+class UVGroup(object):
+    x = 0
+    y = 0
+    w = 0
+    h = 0
+
+    def __init__(self):
+        pass
+
+
+class BoneframeCanFall(object):
+    boneframe = []
+    can_fall = False
+
+    def __init__(self):
+        pass
+
+
+class AnimArrays(object):
+    """
+    Structure-of-arrays storage for an animation. Every keyframe has a
+    duration, a root motion x, y, z triplet and whether any of its bones
+    moves rather than rotates; every keyframe and bone a bone type and a
+    vector, stored keyframe by keyframe as bone_types[keyframe * bones +
+    bone] and vectors[3 * (keyframe * bones + bone)].
+    """
+
+    def __init__(self):
+        self.lengths = array('H')
+        self.root = array('d')
+        self.can_fall = array('B')
+        self.bone_types = array('h')
+        # Angles in degrees for rotations, positions in world units otherwise
+        self.vectors = array('d')
+
+
+class Boneframe(ArrayView):
+    __slots__ = ()
+    bone_type = _array_field('bone_types')
+
+    @property
+    def vector(self):
+        return tuple(self._arrays.vectors[3 * self.index:3 * self.index + 3])
+
+
+class Keyframe(ArrayView):
+    __slots__ = ('boneframes',)
+    length = _array_field('lengths')
+    x = _array_field('root', 3, 0)
+    y = _array_field('root', 3, 1)
+    z = _array_field('root', 3, 2)
+
+    def __init__(self, arrays, index, num_boneframes):
+        ArrayView.__init__(self, arrays, index)
+        first = index * num_boneframes
+        self.boneframes = [Boneframe(arrays, i) for i in range(first, first + num_boneframes)]
+
+    @property
+    def can_fall(self):
+        return bool(self._arrays.can_fall[self.index])
+
+
+class Anim(object):
+    """
+    A parsed animation. Keyframe data lives in self.arrays; keyframes is a
+    list of views over it that is only built when asked for.
+    """
+    num_keyframes = 0
+    num_boneframes = 0
+    loop_frame = 0
+    unk1 = 0
+
+    def __init__(self, arrays=None):
+        self.arrays = arrays if arrays is not None else AnimArrays()
+        self.buffer = []
+        self._keyframes = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_keyframes'] = None
+        return state
+
+    @property
+    def keyframes(self):
+        if self._keyframes is None:
+            self._keyframes = [Keyframe(self.arrays, i, self.num_boneframes) for i in range(self.num_keyframes)]
+        return self._keyframes
+
+
+def read_lba2_model(lm2):
+    r = EntryReader(lm2)
+
+    # # HEADER # #
+    body_flag = r.s32()  # 0x00
+    unk1 = r.s32()  # 0x04
+    x_min = r.s32()  # 0x08
+    x_max = r.s32()  # 0x0C
+    y_min = r.s32()  # 0x10
+    y_max = r.s32()  # 0x14
+    z_min = r.s32()  # 0x18
+    z_max = r.s32()  # 0x1C
+    bones_size = r.u32()  # 0x20
+    bones_offset = r.u32()  # 0x24
+    vertices_size = r.u32()  # 0x28
+    vertices_offset = r.u32()  # 0x2C
+    normals_size = r.u32()  # 0x30
+    normals_offset = r.u32()  # 0x34
+    unk1_size = r.u32()  # 0x38
+    unk1_offset = r.u32()  # 0x3C
+    polygons_size = r.u32()  # 0x40
+    polygons_offset = r.u32()  # 0x44
+    lines_size = r.u32()  # 0x48
+    lines_offset = r.u32()  # 0x4C
+    spheres_size = r.u32()  # 0x50
+    spheres_offset = r.u32()  # 0x54
+    uv_groups_size = r.u32()  # 0x58
+    uv_groups_offset = r.u32()  # 0x5C
+    version = body_flag & 0xff
+    has_animation = body_flag & (1 << 8)
+    no_sort = body_flag & (1 << 9)
+    has_transparency = body_flag & (1 << 10)
+
+    # # BONE # #
+    r.seek(bones_offset)
+    bones = []
+    for parent, vertex, bone_unk1, bone_unk2 in r.records('HHHH', bones_size):
+        bone = OriginalBone()
+        bone.parent = parent
+        bone.vertex = vertex
+        bone.unk1 = bone_unk1
+        bone.unk2 = bone_unk2
+        bones.append(bone)
+
+    # # VERTEX # #
+    lba2_model = LBA2Model()
+    arrays = lba2_model.arrays
+    r.seek(vertices_offset)
+    values = r.values('hhhH', vertices_size)
+    points = [c * WORLD_SCALE for xyz in zip(values[0::4], values[1::4], values[2::4]) for c in xyz]
+    arrays.vertex_bones = array('H', values[3::4])
+    # Vertices are relative to their bone, move each one by its bone's world offset
+    bone_offsets = bone_world_offsets(bones, points)
+    arrays.vertices = array('f', [p + o for p, o in zip(
+        points, itertools.chain.from_iterable(bone_offsets[bone] for bone in arrays.vertex_bones))])
+
+    # # NORMAL # #
+    r.seek(normals_offset)
+    values = r.values('hhhH', normals_size)
+    arrays.normals = array('f', [c * WORLD_SCALE for xyz in zip(values[0::4], values[1::4], values[2::4])
+                                 for c in xyz])
+    arrays.normal_unk1 = array('H', values[3::4])
+
+    # # UNKNOWN1 # #
+    r.seek(unk1_offset)
+    unknown1s = []
+    for values in r.records('HHHH', unk1_size):
+        unknown1 = Unknown1()
+        unknown1.unk1, unknown1.unk2, unknown1.unk3, unknown1.unk4 = values
+        unknown1s.append(unknown1)
+
+    # # POLYGON # #
+    r.seek(polygons_offset)
+    while r.tell() < lines_offset:
+        render_type, num_polygons, section_size, unk1 = r.values('HHHH', 1)
+        if section_size == 0:
+            break
+
+        # Polygons of a section are fixed-size blocks following its header
+        block_size = (section_size - 8) // num_polygons
+        section = r.reader(r.tell(), num_polygons * block_size)
+        if not load_polygon_section(section, arrays, render_type, num_polygons, block_size):
+            for i in range(num_polygons):
+                load_polygon(section, arrays, i * block_size, render_type, block_size)
+        r.skip(num_polygons * block_size)
+
+    # # LINE # #
+    r.seek(lines_offset)
+    values = r.values('HHHH', lines_size)
+    arrays.line_unk1 = array('H', values[0::4])
+    arrays.line_colours = array('B', [(colour & 0x00FF) // 16 for colour in values[1::4]])
+    arrays.lines = array('H', [v for pair in zip(values[2::4], values[3::4]) for v in pair])
+
+    # # SPHERE # #
+    r.seek(spheres_offset)
+    values = r.values('HHHH', spheres_size)
+    arrays.sphere_unk1 = array('H', values[0::4])
+    arrays.sphere_colours = array('B', [(colour & 0x00FF) // 16 for colour in values[1::4]])
+    arrays.spheres = array('H', [v for pair in zip(values[2::4], values[3::4]) for v in pair])
+
+    # # TEXTURE # #
+    r.seek(uv_groups_offset)
+    uvgroups = []
+    for x, y, w, h in r.records('BBBB', uv_groups_size):
+        uvgroup = UVGroup()
+        uvgroup.x = x
+        uvgroup.y = y
+        uvgroup.w = w
+        uvgroup.h = h
+        uvgroups.append(uvgroup)
+
+    lba2_model.bones = bones
+    lba2_model.uvgroups = uvgroups
+    # Polygons sharing every palette colour, in order of first use
+    lba2_model.colour_faces = {}
+    for i, colour in enumerate(arrays.poly_colours):
+        lba2_model.colour_faces.setdefault(colour, []).append(i)
+    return lba2_model
+
+
+def bone_world_offsets(bones, points):
+    # Sum the bone vertex positions along each bone's chain up to the root, visiting parents first
+    offsets = [None] * len(bones)
+    for i in range(len(bones)):
+        chain = []
+        bone_index = i
+        while offsets[bone_index] is None:
+            chain.append(bone_index)
+            parent = bones[bone_index].parent
+            if parent > 1000:
+                break
+            if len(chain) > len(bones):
+                raise RuntimeError("bone %u is part of a cycle" % i)
+            bone_index = parent
+        parent_offset = (0., 0., 0.) if offsets[bone_index] is None else offsets[bone_index]
+        for bone_index in reversed(chain):
+            vertex = 3 * bones[bone_index].vertex
+            parent_offset = (points[vertex] + parent_offset[0],
+                             points[vertex + 1] + parent_offset[1],
+                             points[vertex + 2] + parent_offset[2])
+            offsets[bone_index] = parent_offset
+    return offsets
+
+
+# Record format of a polygon block and where its fields start in the unpacked record
+_polygon_layouts = {}
+
+
+def polygon_layout(num_vertex, has_tex, block_size):
+    key = (num_vertex, has_tex, block_size)
+    if key not in _polygon_layouts:
+        if not has_tex:
+            fmt = '%dH%dxHh' % (num_vertex, 8 - 2 * num_vertex)
+            fields = {'colour': num_vertex, 'intensity': num_vertex + 1, 'uvs': None, 'tex': None}
+        elif num_vertex == 3:
+            fmt = '3HBxHh' + 'xBxB' * 3
+            fields = {'tex': 3, 'colour': 4, 'intensity': 5, 'uvs': 6}
+        else:
+            fmt = '4HHh' + 'xBxB' * 4 + 'B'
+            fields = {'colour': 4, 'intensity': 5, 'uvs': 6, 'tex': 14}
+        size = struct.calcsize('<' + fmt)
+        if size > block_size:
+            # Blocks too short for their fields are left to load_polygon
+            _polygon_layouts[key] = None
+        else:
+            fields['stride'] = len(struct.unpack('<' + fmt, b'\0' * size))
+            _polygon_layouts[key] = (fmt + '%dx' % (block_size - size), fields)
+    return _polygon_layouts[key]
+
+
+def load_polygon_section(data, arrays, render_type, num_polygons, block_size):
+    # Unpack every polygon of a section at once and append each field as a column
+    num_vertex = 4 if (render_type & 0x8000) else 3
+    has_tex = bool(render_type & 0x8) and block_size > 16
+    layout = polygon_layout(num_vertex, has_tex, block_size)
+    if layout is None:
+        return False
+    fmt, fields = layout
+    values = data.values(fmt, num_polygons)
+    stride = fields['stride']
+
+    start = len(arrays.poly_indices)
+    arrays.poly_starts.extend(range(start, start + num_vertex * num_polygons, num_vertex))
+    arrays.poly_counts.extend(array('B', [num_vertex]) * num_polygons)
+    arrays.poly_render_types.extend(array('H', [render_type]) * num_polygons)
+    arrays.poly_has_tex.extend(array('B', [has_tex]) * num_polygons)
+    arrays.poly_indices.extend(itertools.chain.from_iterable(
+        values[i:i + num_vertex] for i in range(0, len(values), stride)))
+    arrays.poly_colours.extend((colour & 0x00FF) // 16 for colour in values[fields['colour']::stride])
+    arrays.poly_intensities.extend(values[fields['intensity']::stride])
+    if has_tex:
+        uvs = fields['uvs']
+        arrays.poly_uvs.extend(itertools.chain.from_iterable(
+            values[i + uvs:i + uvs + 2 * num_vertex] for i in range(0, len(values), stride)))
+        arrays.poly_textures.extend(values[fields['tex']::stride])
+    else:
+        arrays.poly_uvs.extend(array('B', [0]) * (2 * num_vertex * num_polygons))
+        arrays.poly_textures.extend(array('B', [0]) * num_polygons)
+    return True
+
+
+def load_polygon(data, arrays, offset, render_type, block_size):
+    num_vertex = 4 if (render_type & 0x8000) else 3
+    has_tex = bool(render_type & 0x8) and block_size > 16
+    arrays.poly_starts.append(len(arrays.poly_indices))
+    arrays.poly_counts.append(num_vertex)
+    arrays.poly_render_types.append(render_type)
+    arrays.poly_has_tex.append(has_tex)
+    arrays.poly_indices.extend(data.unpack_at('<%dH' % num_vertex, offset))
+
+    colour, intensity = data.unpack_at('<Hh', offset + 8)
+    arrays.poly_colours.append((colour & 0x00FF) // 16)
+    arrays.poly_intensities.append(intensity)
+
+    tex = 0
+    if has_tex:
+        # Each vertex has a u and a v byte, both following a padding byte
+        arrays.poly_uvs.extend(data.unpack_at('<' + 'xBxB' * num_vertex, offset + 12))
+        # Triangles store their texture right after the indices, quads after the UVs
+        tex = data.unpack_at('<B', offset + (6 if num_vertex == 3 else 28))[0]
+    else:
+        arrays.poly_uvs.extend((0, 0) * num_vertex)
+    arrays.poly_textures.append(tex)
+
+
+def read_lba2_anim(anm):
+    r = EntryReader(anm)
+    anim = Anim()
+    anim.num_keyframes = r.u16()
+    anim.num_boneframes = r.u16()
+    anim.loop_frame = r.u16()
+    anim.unk1 = r.u16()
+    # Every keyframe is a header followed by one record per boneframe
+    stride = 4 + 4 * anim.num_boneframes
+    values = r.values('Hhhh' + 'hhhh' * anim.num_boneframes, anim.num_keyframes)
+    arrays = anim.arrays
+    arrays.lengths = array('H', values[0::stride])
+    arrays.root = array('d', [c * WORLD_SCALE for k in range(0, len(values), stride) for c in values[k + 1:k + 4]])
+    boneframes = [v for k in range(0, len(values), stride) for v in values[k + 4:k + stride]]
+    arrays.bone_types = array('h', boneframes[0::4])
+    rotation = 360. / 4096.
+    arrays.vectors = array('d', [c * (rotation if bone_type == 0 else WORLD_SCALE)
+                                 for bone_type, x, y, z in zip(boneframes[0::4], boneframes[1::4],
+                                                               boneframes[2::4], boneframes[3::4])
+                                 for c in (x, y, z)])
+    # Keyframes with a bone that moves rather than rotates
+    bones = anim.num_boneframes
+    arrays.can_fall = array('B', [any(arrays.bone_types[k * bones:(k + 1) * bones])
+                                  for k in range(anim.num_keyframes)])
+    return anim
+
+
+def wrap_rotations(angles):
+    # Unwrap a whole block of angles in degrees at once. Every angle is unwrapped against a previous angle
+    # of zero, as keys always were, so each one only moves by a turn to fall within -180 and 180.
+    return array('d', [angle + 360 if angle < -180 else angle - 360 if angle > 180 else angle for angle in angles])